@@ -1,7 +1,38 @@
+import collections
 import itertools
 import random
 
 
+def neighbour_table(height, width):
+    """
+    Returns a dict mapping every cell on a height x width board
+    to the frozenset of cells around it.
+    """
+    return {
+        (i, j): frozenset(
+            (i + di, j + dj)
+            for di in (-1, 0, 1)
+            for dj in (-1, 0, 1)
+            if (di or dj) and 0 <= i + di < height and 0 <= j + dj < width
+        )
+        for i in range(height)
+        for j in range(width)
+    }
+
+
+def cells_mask(cells, width):
+    """
+    Returns the bitmask with bit i * width + j set for every (i, j) in cells.
+    Raises ValueError for a cell that is not on a board `width` columns wide.
+    """
+    mask = 0
+    for i, j in cells:
+        if i < 0 or not 0 <= j < width:
+            raise ValueError(f"cell {(i, j)} is not on a board {width} columns wide")
+        mask |= 1 << (i * width + j)
+    return mask
+
+
 class Minesweeper():
     """
     Minesweeper game representation
@@ -14,25 +45,27 @@ class Minesweeper():
         self.width = width
         self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        # Initialize an empty field with no mines,
+        # stored as a bitmask with bit i * width + j for cell (i, j)
+        self.board_bits = 0
 
         # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        for k in random.sample(range(height * width), mines):
+            self.mines.add(divmod(k, width))
+            self.board_bits |= 1 << k
 
         # At first, player has found no mines
         self.mines_found = set()
 
+        # Precompute the in-bounds neighbours of every cell
+        self._neighbours = neighbour_table(height, width)
+
+        # Bitmask of the neighbours of every cell, indexed like board_bits
+        self._neighbour_masks = [
+            cells_mask(self._neighbours[divmod(k, width)], width)
+            for k in range(height * width)
+        ]
+
     def print(self):
         """
         Prints a text-based representation
@@ -41,16 +74,25 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.is_mine((i, j)):
                     print("|X", end="")
                 else:
                     print("| ", end="")
             print("|")
         print("--" * self.width + "-")
 
-    def is_mine(self, cell):
+    def _index(self, cell):
+        """
+        Returns the board_bits index of cell, raising IndexError
+        if cell is not on the board.
+        """
         i, j = cell
-        return self.board[i][j]
+        if not (0 <= i < self.height and 0 <= j < self.width):
+            raise IndexError(f"cell {cell} is not on the board")
+        return i * self.width + j
+
+    def is_mine(self, cell):
+        return bool(self.board_bits >> self._index(cell) & 1)
 
     def nearby_mines(self, cell):
         """
@@ -59,39 +101,13 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-        return count
+        return (self.board_bits & self._neighbour_masks[self._index(cell)]).bit_count()
     
     def neighbourhood(self, cell):
         '''
         Returns a set of all cells around given cell
         '''
-        cells = set()
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    cells.add((i,j))
-        return cells
+        return set(self._neighbours[cell])
                 
     def won(self):
         """
@@ -107,37 +123,69 @@ class Sentence():
     and a count of the number of those cells which are mines.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    __slots__ = ("width", "count", "mask", "popcount", "dead")
+
+    def __init__(self, cells, count, *, width=8):
+        self.width = width
         self.count = count
 
+        # Set once the sentence is resolved and can be dropped
+        self.dead = False
+
+        # Cells are stored as a bitmask, one bit per board cell,
+        # with the number of set bits kept alongside it
+        self.mask = cells_mask(cells, width)
+        self.popcount = self.mask.bit_count()
+
+    @property
+    def cells(self):
+        """
+        Returns the frozenset of cells covered by self.mask.
+        """
+        cells = set()
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            cells.add(divmod(low.bit_length() - 1, self.width))
+            mask ^= low
+        return frozenset(cells)
+
+    def bit(self, cell):
+        """
+        Returns the bitmask with only the bit for cell set.
+        """
+        i, j = cell
+        return 1 << (i * self.width + j)
+
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        if not isinstance(other, Sentence):
+            return NotImplemented
+        if self.width != other.width:
+            return self.cells == other.cells and self.count == other.count
+        return self.mask == other.mask and self.count == other.count
 
     def __str__(self):
-        return f"{self.cells} = {self.count}"
+        return f"{set(self.cells)} = {self.count}"
     
     def __repr__(self):
-        return f"{self.cells} = {self.count}"    
+        return f"{set(self.cells)} = {self.count}"    
 
     def known_mines(self):          #USER
         """
-        Returns the set of all cells in self.cells known to be mines.
+        Returns the set of all cells in the sentence known to be mines.
         """
 
-        if (self.count != 0):
-            if len(self.cells) == self.count:
-                # print(f"Mines = {self.cells}")
-                return self.cells
+        if self.count != 0 and self.popcount == self.count:
+            return self.cells
 
 
     def known_safes(self):          #USER
         """
-        Returns the set of all cells in self.cells known to be safe.
+        Returns the set of all cells in the sentence known to be safe.
         """
 
         if self.count == 0:
-            return self.cells 
+            return self.cells
 
 
     def mark_mine(self, cell):      #USER
@@ -145,25 +193,27 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
-        new_cells = set()
-        if cell in self.cells:
-            new_cells.add(cell)
-            new_cells = self.cells.difference(new_cells)
-            self.cells = new_cells
-            self.count -= 1
-            # print(f"Mine = {self.cells}")
+        bit = self.bit(cell)
+        if self.mask & bit:
+            self.remove(bit, 1)
 
     def mark_safe(self, cell):      #USER
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
-        new_cells = set()
-        if cell in self.cells:
-            new_cells.add(cell)
-            new_cells = self.cells.difference(new_cells)
-            self.cells = new_cells
-            # print(f"Safe: {cell}")
+        self.remove(self.bit(cell), 0)
+
+    def remove(self, bits, mines):
+        """
+        Takes the cells in bits out of the sentence, given that
+        `mines` of the cells removed are mines, keeping
+        self.popcount in step with self.mask.
+        """
+        overlap = self.mask & bits
+        self.mask ^= overlap
+        self.popcount -= overlap.bit_count()
+        self.count -= mines
 
 
 class MinesweeperAI():
@@ -186,25 +236,56 @@ class MinesweeperAI():
 
         # List of sentences about the game known to be true
         self.knowledge : list[Sentence] = []
+        self._known_masks : set[tuple[int, int]] = set()
+
+        # Precompute the in-bounds neighbours of every cell
+        self._neighbours = neighbour_table(height, width)
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
-            print(f"mine = {cell}")
+        self.mark_mines((cell,))
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
+        self.mark_safes((cell,))
+
+    def mark_mines(self, cells):
+        """
+        Marks every cell in cells as a mine, updating
+        each sentence in knowledge once for the whole batch.
+        Returns the sentences that changed.
+        """
+        self.mines.update(cells)
+        bits = cells_mask(cells, self.width)
+        touched = []
+        for sentence in self.knowledge:
+            overlap = sentence.mask & bits
+            if overlap:
+                sentence.remove(overlap, overlap.bit_count())
+                touched.append(sentence)
+        return touched
+
+    def mark_safes(self, cells):
+        """
+        Marks every cell in cells as safe, updating
+        each sentence in knowledge once for the whole batch.
+        Returns the sentences that changed.
+        """
+        self.safes.update(cells)
+        bits = cells_mask(cells, self.width)
+        touched = []
         for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+            overlap = sentence.mask & bits
+            if overlap:
+                sentence.remove(overlap, 0)
+                touched.append(sentence)
+        return touched
 
     def add_knowledge(self, cell, count):
         """
@@ -235,77 +316,79 @@ class MinesweeperAI():
             # print(f"{cell} already in Safes")
 
         #3
-        cells: set = self.neighbourhood(cell)
-        cells.difference_update(self.safes)
-        NewSentence = Sentence(cells, count)
-        
-        for cell in NewSentence.cells:
-            if cell in self.mines:
-                NewSentence.mark_mine(cell)
-                
-        self.knowledge.append(NewSentence)
+        # Leave out known safes, and take known mines out of the count
+        cells = self._neighbours[cell] - self.safes
+        known_mines = cells & self.mines
+        NewSentence = Sentence(cells - known_mines, count - len(known_mines), width=self.width)
+
+        # Skip sentences that have already been added once
+        key = (NewSentence.mask, NewSentence.count)
+        if key not in self._known_masks:
+            self._known_masks.add(key)
+            self.knowledge.append(NewSentence)
         # print(f"{NewSentence = }")
 
-        #4
-        for sentence in self.knowledge:
-            if sentence.known_mines():
-                for cell in sentence.known_mines().copy():
-                    self.mark_mine(cell)
-            if sentence.known_safes():
-                for cell in sentence.known_safes().copy():
-                    self.mark_safe(cell)
-        
-        
-        self.check_knowledge(NewSentence)
-        for i in range(2):
-            for sentence in self.knowledge:
-                # print(f"checking Knowledge for {sentence}")
-                self.check_knowledge(sentence)
-
+        #4 and #5
+        # Work through sentences until nothing changes, queueing
+        # a sentence again only when its cells or count change
+        queue = collections.deque(self.knowledge)
+        while queue:
+            sentence = queue.popleft()
+            if sentence.dead:
+                continue
+
+            touched = self.check_knowledge(sentence)
+            if sentence.dead:
+                queue.extend(touched)
+                continue
+
+            # The sentence is tested both ways: its subsets have at most
+            # as many cells and its supersets have more, so every size
+            # has to be scanned and bucketing by popcount saves nothing
+            for sentence2 in self.knowledge:
+                if sentence2 is sentence or sentence2.dead or not sentence2.mask:
+                    continue
+                # A subset can't have more cells, so the popcounts
+                # decide which direction is worth testing
+                if sentence2.popcount <= sentence.popcount:
+                    if sentence2.mask & sentence.mask == sentence2.mask:
+                        # sentence2 is subset of sentence
+                        sentence.remove(sentence2.mask, sentence2.count)
+                        queue.append(sentence)
+                        break
+                elif sentence.mask & sentence2.mask == sentence.mask:
+                    # sentence is subset of sentence2
+                    sentence2.remove(sentence.mask, sentence.count)
+                    queue.append(sentence2)
+
+        self.knowledge = [
+            sentence for sentence in self.knowledge if not sentence.dead
+        ]
 
         # raise NotImplementedError
 
     def check_knowledge(self, sentence: Sentence):
-        # print(sentence)
-        if len(sentence.cells) == 0:                    #Empty sentence
-            self.knowledge.remove(sentence) 
-        elif sentence.count == 0:
-            for cell in sentence.cells:                 #All cells are safe
-                self.mark_safe(cell) 
-            self.knowledge.remove(sentence)
-        elif len(sentence.cells) == sentence.count:     #All cells are mines
-            for cell in sentence.cells:
-                self.mark_mine(cell)
-            self.knowledge.remove(sentence)
-
-        for sentence2 in self.knowledge:
-            if sentence2.cells < sentence.cells:        # sentence2 is subset of sentence 
-                sentence.cells.difference_update(sentence2.cells)
-                sentence.count -= sentence2.count
-                # self.knowledge.remove(sentence2)
-                # print(f"After removing subset {sentence = }")
-            if sentence2.cells > sentence.cells:        # sentence2 is superset of sentence
-                sentence2.cells.difference_update(sentence.cells)
-                sentence2.count -= sentence.count
-                # self.knowledge.remove(sentence2)  
-                # print(f"After removing subset {sentence = }")
+        """
+        Marks the cells of a sentence as safes or mines when the
+        sentence settles them on its own, and flags it as dead.
+        Returns the other sentences changed by doing so.
+        """
+        if sentence.mask == 0:                          #Empty sentence
+            touched = []
+        elif sentence.count == 0:                       #All cells are safe
+            touched = self.mark_safes(sentence.cells)
+        elif sentence.popcount == sentence.count:       #All cells are mines
+            touched = self.mark_mines(sentence.cells)
+        else:
+            return []
+        sentence.dead = True
+        return touched
 
     def neighbourhood(self, cell):
         '''
         Returns a set of all cells around given cell
         '''
-        cells = set()
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    cells.add((i,j))
-        return cells
+        return set(self._neighbours[cell])
 
     def make_safe_move(self):
         """
@@ -316,8 +399,9 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        for cell in self.safes.difference(self.moves_made):
-            return cell
+        for cell in self.safes:
+            if cell not in self.moves_made:
+                return cell
         # raise NotImplementedError
 
     def make_random_move(self):
@@ -327,41 +411,37 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        #Compute probability for all cells
+        #Compute probability for all cells, indexed like Sentence bits
+        scores = [0.0] * (self.height * self.width)
+        frontier = 0
         for sentence in self.knowledge:
-            print (sentence)
-            single_probability = sentence.count/len(sentence.cells)
-            for cell in sentence.cells:
-                if cell not in Cell_stat.all_cell.keys():
-                    Cell_stat.all_cell[cell] = single_probability
-                elif cell in Cell_stat.all_cell.keys():
-                    Cell_stat.all_cell[cell] += single_probability
-        print(Cell_stat.all_cell)
-
-        if Cell_stat.all_cell:
-            min_key = min(Cell_stat.all_cell, key=Cell_stat.all_cell.get)
-            print(f"Min key = {min_key} \n min value = {Cell_stat.all_cell[min_key]} ")
-            return min_key
+            single_probability = sentence.count / sentence.popcount
+            frontier |= sentence.mask
+            mask = sentence.mask
+            while mask:
+                low = mask & -mask
+                scores[low.bit_length() - 1] += single_probability
+                mask ^= low
+
+        candidates = [
+            k for k in range(len(scores))
+            if frontier >> k & 1
+            and divmod(k, self.width) not in self.moves_made
+            and divmod(k, self.width) not in self.mines
+        ]
+        if candidates:
+            return divmod(min(candidates, key=scores.__getitem__), self.width)
         else:                           #If no probability exists, play random
             for i in range(self.height):
                 for j in range(self.width):
                     if (i,j) not in self.mines.union(self.moves_made):
                         return(i,j)
 
-class Cell_stat():
-
-    all_cell = {}
-    def __init__(self, cell_location, probability) -> None:
-        self.cell_location = cell_location
-        self.probability = probability
-
-
-    
 
 def main():
     mn = Minesweeper()
     mn.print()
-    print(mn.board)
+    print(f"{mn.board_bits:b}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file